@@ -0,0 +1,228 @@
+import os
+import zlib
+import queue
+import shutil
+import struct
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+# Streams beatmapset downloads to disk through a background I/O thread.
+# While streaming, the zip central directory index is read from the data in memory,
+# so the archive can be validated and extracted without reading the downloaded file back in full.
+
+first_chunk_size = 64 * 1024  # 64KB in Bytes
+max_chunk_size = 1024 * 1024  # 1MB in Bytes
+tail_size = 1024 * 1024  # Bytes kept from the end of the download to find the central directory in
+write_buffer_size = 1024 * 1024
+
+EOCD_SIGNATURE = b"PK\x05\x06"
+EOCD_FORMAT = "<4s4H2LH"
+CENTRAL_DIRECTORY_SIGNATURE = b"PK\x01\x02"
+CENTRAL_DIRECTORY_FORMAT = "<4s6H3L5H2L"
+LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+LOCAL_HEADER_FORMAT = "<4s5H3L2H"
+
+def write_chunks(file_path, chunks):
+    """
+    Writes chunks from the queue to the file until None is received.
+    Keeps draining the queue after a write error so the downloading thread never blocks, then raises the error.
+    """
+    error = None
+    file = None
+    try:
+        file = open(file_path, "wb", buffering=write_buffer_size)
+    except OSError as e:
+        error = e
+
+    while True:
+        chunk = chunks.get()
+        if chunk is None:
+            break
+        if error is None:
+            try:
+                file.write(chunk)
+            except OSError as e:
+                error = e
+
+    if file:
+        file.close()
+    if error:
+        raise error
+
+def read_zip_index(tail, total_size):
+    """
+    Reads the zip central directory from the end of the archive.
+    Returns a dict of file name -> (header offset, compressed size, size, CRC, compression method, flags),
+    or None if the central directory doesn't fit in the tail or the archive is ZIP64.
+    Raises zipfile.BadZipFile if the archive is corrupt.
+    """
+    eocd_position = tail.rfind(EOCD_SIGNATURE)
+    if eocd_position == -1 or len(tail) - eocd_position < struct.calcsize(EOCD_FORMAT):
+        raise zipfile.BadZipFile("End of central directory not found")
+
+    (_, _, _, _, entries, directory_size, directory_offset, comment_length) = struct.unpack_from(EOCD_FORMAT, tail, eocd_position)
+    if eocd_position + struct.calcsize(EOCD_FORMAT) + comment_length != len(tail):
+        raise zipfile.BadZipFile("Archive is truncated or has trailing data")
+    if entries == 0xFFFF or directory_offset == 0xFFFFFFFF:
+        return None
+
+    tail_start = total_size - len(tail)
+    if directory_offset + directory_size != tail_start + eocd_position:
+        raise zipfile.BadZipFile("Central directory is not where the archive says it is")
+    if directory_offset < tail_start:
+        return None
+
+    index = {}
+    position = directory_offset - tail_start
+    header_size = struct.calcsize(CENTRAL_DIRECTORY_FORMAT)
+    for _ in range(entries):
+        if position + header_size > eocd_position:
+            raise zipfile.BadZipFile("Central directory is truncated")
+        header = struct.unpack_from(CENTRAL_DIRECTORY_FORMAT, tail, position)
+        if header[0] != CENTRAL_DIRECTORY_SIGNATURE:
+            raise zipfile.BadZipFile("Bad central directory entry")
+
+        flags, method, crc, compressed_size, size = header[3], header[4], header[7], header[8], header[9]
+        name_length, extra_length, comment_length, header_offset = header[10], header[11], header[12], header[16]
+        if header_offset + compressed_size > directory_offset:
+            raise zipfile.BadZipFile("Archive member is outside of the archive")
+
+        raw_name = bytes(tail[position + header_size:position + header_size + name_length])
+        name = raw_name.decode("utf-8" if flags & 0x800 else "cp437")
+        index[name] = (header_offset, compressed_size, size, crc, method, flags)
+        position += header_size + name_length + extra_length + comment_length
+
+    if position != eocd_position:
+        raise zipfile.BadZipFile("Central directory size doesn't match its entries")
+    return index
+
+def read_zip_index_from_file(file_path):
+    """
+    Reads the zip central directory with zipfile, in the same format as read_zip_index.
+    """
+    with zipfile.ZipFile(file_path, "r") as zip_ref:
+        return {
+            info.filename: (info.header_offset, info.compress_size, info.file_size, info.CRC, info.compress_type, info.flag_bits)
+            for info in zip_ref.infolist()
+        }
+
+def download_beatmapset(url, temp_path):
+    """
+    Downloads the beatmapset zip to temp_path and validates it.
+    Chunks start small and grow while the download keeps filling them, and are written by a background I/O thread.
+    Returns the zip index, raises zipfile.BadZipFile for corrupt downloads.
+    Network errors are raised as requests exceptions, like iter_content would.
+    """
+    import requests
+    from tqdm import tqdm
+    from urllib3.exceptions import HTTPError as Urllib3Error, DecodeError
+
+    tail = bytearray()
+    total = 0
+    chunks = queue.Queue(maxsize=16)
+
+    with requests.get(url, stream=True, timeout=10) as resp, ThreadPoolExecutor(max_workers=1) as io_thread:
+        resp.raise_for_status()
+        # Content-Length counts the encoded bytes, it can only be checked against the content if there is no encoding
+        encoded = resp.headers.get('content-encoding', 'identity').lower() != 'identity'
+        total_size = 0 if encoded else int(resp.headers.get('content-length', 0))
+        writer = io_thread.submit(write_chunks, temp_path, chunks)
+
+        try:
+            with tqdm(
+                    desc="Downloading",
+                    total=total_size,
+                    unit="B",
+                    unit_scale=True,
+                    unit_divisor=1024
+            ) as bar:
+                chunk_size = first_chunk_size
+                while True:
+                    try:
+                        buff = resp.raw.read(chunk_size, decode_content=True)
+                    except DecodeError as e:
+                        raise requests.exceptions.ContentDecodingError(e)
+                    except Urllib3Error as e:
+                        raise requests.ConnectionError(e)
+                    if not buff:
+                        break
+                    chunks.put(buff)
+                    tail += buff
+                    if len(tail) > tail_size:
+                        del tail[:-tail_size]
+                    total += len(buff)
+                    bar.update(len(buff))
+                    if len(buff) == chunk_size:
+                        chunk_size = min(chunk_size * 2, max_chunk_size)
+        finally:
+            chunks.put(None)
+        writer.result()
+
+    if total_size and total != total_size:
+        raise zipfile.BadZipFile(f"Downloaded {total} of {total_size} bytes")
+
+    index = read_zip_index(tail, total)
+    if index is None:
+        index = read_zip_index_from_file(temp_path)
+    return index
+
+def extract_difficulty(zip_path, index, search_text, folder_path):
+    """
+    Extracts the last file whose name contains search_text to a new unique .osu file in folder_path and returns its path.
+    Uses the index from download_beatmapset if given, otherwise zipfile. The file's CRC is checked either way.
+    Every call gets its own file, so concurrent calculations on the same difficulty never read or delete each other's copy.
+    """
+    if index is None:
+        with zipfile.ZipFile(zip_path, "r") as zip_ref:
+            matching_files = [file for file in zip_ref.namelist() if search_text in file]
+    else:
+        matching_files = [file for file in index if search_text in file]
+    if not matching_files:
+        raise FileNotFoundError(f"No file matching {search_text} in {zip_path}")
+    map_file = matching_files[-1]
+
+    file_descriptor, beatmap_file = tempfile.mkstemp(suffix=".osu", dir=folder_path)
+    os.close(file_descriptor)
+    try:
+        if index is None:
+            extract_member_to(zip_path, map_file, beatmap_file)
+        else:
+            extract_member(zip_path, map_file, index[map_file], beatmap_file)
+    except:
+        os.remove(beatmap_file)
+        raise
+    return beatmap_file
+
+def extract_member(zip_path, name, entry, destination):
+    """
+    Extracts a single file from the archive to the destination path using its index entry, seeking straight to its data.
+    Falls back to zipfile for anything other than plain stored or deflated files.
+    """
+    header_offset, compressed_size, size, crc, method, flags = entry
+    if method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED) or flags & 0x1:
+        extract_member_to(zip_path, name, destination)
+        return
+
+    with open(zip_path, "rb") as f:
+        f.seek(header_offset)
+        header = struct.unpack(LOCAL_HEADER_FORMAT, f.read(struct.calcsize(LOCAL_HEADER_FORMAT)))
+        if header[0] != LOCAL_HEADER_SIGNATURE:
+            raise zipfile.BadZipFile(f"Bad local header for {name}")
+        f.seek(header[9] + header[10], os.SEEK_CUR)
+        data = f.read(compressed_size)
+
+    if method == zipfile.ZIP_DEFLATED:
+        data = zlib.decompress(data, -15)
+    if len(data) != size or zlib.crc32(data) != crc:
+        raise zipfile.BadZipFile(f"Bad CRC or size for {name}")
+
+    with open(destination, "wb") as file:
+        file.write(data)
+
+def extract_member_to(zip_path, name, destination):
+    """
+    Extracts a single file from the archive to the destination path with zipfile.
+    """
+    with zipfile.ZipFile(zip_path, "r") as zip_ref, zip_ref.open(name) as source, open(destination, "wb") as file:
+        shutil.copyfileobj(source, file)
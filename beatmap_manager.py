@@ -1,13 +1,16 @@
 import os
 import json
+import threading
 
 # The BeatmapManager class is responsible for managing beatmap files within a specified directory.
 # It provides methods to add, use, and delete beatmap files, as well as to save and load the manager's state.
+# Downloads run in worker threads, so changes to the beatmap list and saving are guarded by a lock.
 class BeatmapManager:
     def __init__(self, base_directory: str, max_directory_size: int = None):
         self.base_directory = base_directory
         self.beatmap_ids = []
         self.max_directory_size = max_directory_size
+        self.lock = threading.RLock()
 
     def get_file_path(self, beatmapset_id: int) -> str:
         """
@@ -19,8 +22,9 @@ class BeatmapManager:
         """
         Adds a beatmapset ID to the manager and checks if the directory size exceeds the maximum limit.
         """
-        if beatmapset_id not in self.beatmap_ids:
-            self.beatmap_ids.append(beatmapset_id)
+        with self.lock:
+            if beatmapset_id not in self.beatmap_ids:
+                self.beatmap_ids.append(beatmapset_id)
 
         if self.max_directory_size and self.get_directory_size() > self.max_directory_size:
             self.delete_least_used_file()
@@ -29,12 +33,13 @@ class BeatmapManager:
         """
         Moves the specified beatmapset ID to the first position in the list.
         """
-        if beatmapset_id not in self.beatmap_ids:
-            print(f"Beatmapset {beatmapset_id} not found!")
-            return
+        with self.lock:
+            if beatmapset_id not in self.beatmap_ids:
+                print(f"Beatmapset {beatmapset_id} not found!")
+                return
 
-        self.beatmap_ids.remove(beatmapset_id)
-        self.beatmap_ids.insert(0, beatmapset_id)
+            self.beatmap_ids.remove(beatmapset_id)
+            self.beatmap_ids.insert(0, beatmapset_id)
 
     def get_sorted_paths(self):
         """
@@ -46,11 +51,12 @@ class BeatmapManager:
         """
         Deletes the least used beatmap file from the directory.
         """
-        if not self.beatmap_ids:
-            print("No beatmap files to delete.")
-            return
+        with self.lock:
+            if not self.beatmap_ids:
+                print("No beatmap files to delete.")
+                return
 
-        least_used_id = self.beatmap_ids.pop()
+            least_used_id = self.beatmap_ids.pop()
         file_path = self.get_file_path(least_used_id)
 
         print(f"Deleting least used beatmap file: {file_path}")
@@ -76,9 +82,10 @@ class BeatmapManager:
         """
         Saves the current state of the beatmap manager to a JSON file.
         """
-        data = {"beatmap_ids": self.beatmap_ids, "base_directory": self.base_directory}
-        with open(file_path, "w") as file:
-            json.dump(data, file)
+        with self.lock:
+            data = {"beatmap_ids": self.beatmap_ids, "base_directory": self.base_directory}
+            with open(file_path, "w") as file:
+                json.dump(data, file)
 
     @staticmethod
     def load_state(file_path="beatmap_data.json"):
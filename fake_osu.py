@@ -0,0 +1,194 @@
+import os
+import sys
+import json
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from types import SimpleNamespace
+import pp_calc as pp
+
+# Stand-ins for the osu! API and the beatmap mirror, used to load test the bot without touching the live services.
+# RecordingApi wraps a real Ossapi client and saves its responses, ReplayApi serves them back, and
+# start_mirror serves beatmapset zips from a local fixtures directory over HTTP.
+
+STATISTICS = ["great", "ok", "meh", "miss", "large_tick_hit", "large_tick_miss", "slider_tail_hit"]
+
+def record_user(user):
+    """
+    Converts an osu user into the fields the bot uses.
+    """
+    return {"id": user.id, "username": user.username, "avatar_url": user.avatar_url}
+
+def record_score(score):
+    """
+    Converts an osu score into the fields the bot uses.
+    """
+    return {
+        "id": score.id,
+        "accuracy": score.accuracy,
+        "max_combo": score.max_combo,
+        "pp": score.pp,
+        "rank": {"value": score.rank.value},
+        "mods": [{"acronym": mod.acronym, "settings": mod.settings} for mod in score.mods],
+        "statistics": {name: getattr(score.statistics, name) for name in STATISTICS},
+        "beatmap": {
+            "version": score.beatmap.version,
+            "beatmapset_id": score.beatmap.beatmapset_id,
+            "checksum": score.beatmap.checksum
+        },
+        "beatmapset": {
+            "title": score.beatmapset.title,
+            "covers": {"list_2x": score.beatmapset.covers.list_2x}
+        }
+    }
+
+def to_namespace(data):
+    """
+    Turns recorded JSON back into objects with the same attributes as the Ossapi models.
+    Mod settings stay a dict, like in Ossapi.
+    """
+    if isinstance(data, dict):
+        return SimpleNamespace(**{key: value if key == "settings" else to_namespace(value) for key, value in data.items()})
+    if isinstance(data, list):
+        return [to_namespace(value) for value in data]
+    return data
+
+# The RecordingApi class passes calls through to a real Ossapi client and records the responses.
+class RecordingApi:
+    def __init__(self, api):
+        self.api = api
+        self.users = {}
+        self.scores = {}
+
+    def user(self, user, **kwargs):
+        """
+        Retrieves and records an osu user.
+        """
+        result = self.api.user(user, **kwargs)
+        self.users[str(result.id)] = record_user(result)
+        return result
+
+    def user_scores(self, user_id, type, **kwargs):
+        """
+        Retrieves and records the scores of an osu user.
+        """
+        result = self.api.user_scores(user_id=user_id, type=type, **kwargs)
+        self.scores[f'{user_id}:{type}'] = [record_score(score) for score in result]
+        return result
+
+    def save(self, file_path="recordings.json"):
+        """
+        Saves the recorded responses to a JSON file.
+        """
+        with open(file_path, "w") as file:
+            json.dump({"users": self.users, "scores": self.scores}, file)
+
+# The ReplayApi class answers the calls the bot makes with responses saved by RecordingApi.
+class ReplayApi:
+    def __init__(self, file_path="recordings.json"):
+        with open(file_path, "r") as f:
+            data = json.load(f)
+        self.users = {}
+        for user in data["users"].values():
+            self.users[str(user["id"])] = to_namespace(user)
+            self.users[user["username"].lower()] = self.users[str(user["id"])]
+        self.scores = data["scores"]
+
+    def user_ids(self):
+        """
+        Returns the IDs of all recorded users that have recorded scores.
+        """
+        return [int(key.split(":")[0]) for key, scores in self.scores.items() if scores]
+
+    def user(self, user, **kwargs):
+        """
+        Returns a recorded osu user by ID or username.
+        """
+        result = self.users.get(str(user).lower())
+        if result is None:
+            raise ValueError(f"User {user} was not recorded")
+        return result
+
+    def user_scores(self, user_id, type, limit=None, **kwargs):
+        """
+        Returns the recorded scores of an osu user.
+        """
+        scores = self.scores.get(f'{user_id}:{type}', [])
+        return [to_namespace(score) for score in scores[:limit]]
+
+def start_mirror(fixture_directory="fixtures", port=0, delay=0):
+    """
+    Starts an HTTP server serving {fixture_directory}/{beatmapset_id}.zip at /b/{beatmapset_id}.
+    Runs in a background thread and returns the server, its URL is server.url.
+    """
+    fixture_directory = os.path.abspath(fixture_directory)
+
+    class MirrorHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            beatmapset_id = self.path.rstrip("/").split("/")[-1]
+            file_path = os.path.join(fixture_directory, f'{beatmapset_id}.zip')
+            if not beatmapset_id.isdigit() or not os.path.exists(file_path):
+                self.send_error(404)
+                return
+            if delay:
+                time.sleep(delay)
+            with open(file_path, "rb") as file:
+                content = file.read()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/zip")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), MirrorHandler)
+    server.url = f'http://127.0.0.1:{server.server_address[1]}/b/{{}}'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def record(usernames, file_path="recordings.json", fixture_directory="fixtures"):
+    """
+    Records the users and recent scores of the given osu usernames from the live API,
+    and downloads the beatmapsets they played into the fixtures directory.
+    """
+    import requests
+
+    recorder = RecordingApi(pp.init_api())
+    pp.set_api(recorder)
+    os.makedirs(fixture_directory, exist_ok=True)
+
+    for username in usernames:
+        user_id = pp.get_user(username)
+        if user_id is None:
+            print(f"User {username} not found, skipping.")
+            continue
+        pp.get_username(user_id)
+        recent = pp.get_recent_activity(user_id, 10)
+        print(f"Recorded {recent[1]} scores for {username}.")
+
+        for score in recent[0]:
+            beatmapset_id = score.beatmap.beatmapset_id
+            fixture_path = os.path.join(fixture_directory, f'{beatmapset_id}.zip')
+            if os.path.exists(fixture_path):
+                continue
+            resp = requests.get(pp.get_mirror_url().format(beatmapset_id), timeout=30)
+            resp.raise_for_status()
+            with open(fixture_path, "wb") as file:
+                file.write(resp.content)
+
+    recorder.save(file_path)
+    print(f"Saved recordings to {file_path}.")
+
+if __name__ == "__main__":
+    # python fake_osu.py record <username>...  - records live responses and map fixtures
+    # python fake_osu.py serve [port]          - serves the map fixtures as a local mirror
+    if len(sys.argv) >= 3 and sys.argv[1] == "record":
+        record(sys.argv[2:])
+    elif len(sys.argv) >= 2 and sys.argv[1] == "serve":
+        mirror = start_mirror(port=int(sys.argv[2]) if len(sys.argv) >= 3 else 8000)
+        print(f"Serving fixtures at {mirror.url}")
+        threading.Event().wait()
+    else:
+        print("Usage: python fake_osu.py record <username>... | serve [port]")
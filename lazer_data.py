@@ -1,10 +1,14 @@
 import json
 
 lazer_data = {}
+loaded = False
 
 def load_user_lazer_data():
-    """Load user data from a JSON file into memory."""
-    global lazer_data
+    """Load user data from a JSON file into memory, only the first time it is called."""
+    global lazer_data, loaded
+    if loaded:
+        return
+    loaded = True
     try:
         with open("lazer_data.json", "r") as file:
             lazer_data.update(json.load(file))
@@ -18,9 +22,11 @@ def save_user_lazer_data():
 
 def set_user_lazer(discord_user_id, value):
     """Set a value for a given user ID."""
+    load_user_lazer_data()
     lazer_data[discord_user_id] = value
     save_user_lazer_data()
 
 def get_user_lazer(discord_user_id):
     """Get the value associated with a given user ID."""
+    load_user_lazer_data()
     return lazer_data.get(discord_user_id)
\ No newline at end of file
@@ -0,0 +1,268 @@
+import os
+import io
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import contextlib
+from collections import defaultdict
+from types import SimpleNamespace
+import pp_calc as pp
+import user_data
+import lazer_data
+import run_bot
+from beatmap_manager import BeatmapManager
+from pp_cache import PPCache
+from fake_osu import ReplayApi, start_mirror
+
+# Simulates !rs invocations and paginator clicks against the command handlers, without a Discord connection.
+# The osu API is replayed from recordings.json and maps are served from the fixtures directory,
+# see fake_osu.py for recording them. Prints throughput and latency percentiles per pipeline stage.
+
+stage_times = defaultdict(list)
+stage_failures = defaultdict(int)
+dropped_duplicates = 0
+
+# Messages the bot sends while a request is still going fine, any other message means it failed
+PROGRESS_MESSAGES = ("**Map seen for the first time", "**Lots of requests right now", "**Fetching", "**Calculating")
+
+def record(stage, start, succeeded):
+    """
+    Records the duration of a call under the given stage, and counts it as failed if it didn't succeed.
+    """
+    stage_times[stage].append(time.perf_counter() - start)
+    if not succeeded:
+        stage_failures[stage] += 1
+
+def timed(stage, func, check=None):
+    """
+    Wraps a function so the duration and outcome of each call is recorded under the given stage.
+    A call fails if it raises, or if check returns False for its result.
+    """
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        succeeded = False
+        try:
+            result = func(*args, **kwargs)
+            succeeded = check is None or check(result)
+            return result
+        finally:
+            record(stage, start, succeeded)
+    return wrapper
+
+def timed_async(stage, func, check=None):
+    """
+    Wraps a coroutine function so the duration and outcome of each call is recorded under the given stage.
+    A call fails if it raises, or if check returns False for its result.
+    """
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        succeeded = False
+        try:
+            result = await func(*args, **kwargs)
+            succeeded = check is None or check(result)
+            return result
+        finally:
+            record(stage, start, succeeded)
+    return wrapper
+
+def is_failure(content):
+    """
+    Checks if a message the bot sent reports a failure.
+    """
+    return bool(content) and not content.startswith(PROGRESS_MESSAGES)
+
+# The Fake* classes provide the parts of discord messages and interactions the command handlers use.
+class FakeMessage:
+    next_id = 1
+
+    def __init__(self, content=None, embed=None, view=None):
+        self.id = FakeMessage.next_id
+        FakeMessage.next_id += 1
+        self.content = content
+        self.embed = embed
+        self.view = view
+        self.edits = 0
+
+    async def edit(self, **kwargs):
+        self.edits += 1
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+class FakeResponse:
+    def __init__(self, message, sent):
+        self.message = message
+        self.sent = sent
+        self.done = False
+
+    def is_done(self):
+        return self.done
+
+    async def defer(self, **kwargs):
+        self.done = True
+
+    async def send_message(self, content=None, **kwargs):
+        self.done = True
+        self.sent.append(content)
+
+    async def edit_message(self, **kwargs):
+        self.done = True
+        await self.message.edit(**kwargs)
+
+    async def send_modal(self, modal):
+        self.done = True
+
+class FakeFollowup:
+    def __init__(self, message):
+        self.message = message
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append(content)
+        return FakeMessage(content)
+
+    async def edit_message(self, message_id, **kwargs):
+        await self.message.edit(**kwargs)
+
+class FakeInteraction:
+    def __init__(self, message, user_id):
+        self.message = message
+        self.user = SimpleNamespace(id=user_id)
+        self.followup = FakeFollowup(message)
+        self.response = FakeResponse(message, self.followup.sent)
+
+async def simulate_user(discord_user_id, guild_id, clicks):
+    """
+    Runs !rs for the discord user, then clicks random enabled navigation buttons.
+    !rs succeeds if it ends with the score message and its buttons, a click succeeds if it sends no error.
+    """
+    global dropped_duplicates
+    messages = []
+
+    async def send(content=None, embed=None, view=None):
+        message = FakeMessage(content, embed, view)
+        messages.append(message)
+        return message
+
+    start = time.perf_counter()
+    try:
+        await run_bot.recent_play(discord_user_id, guild_id, send)
+    except Exception as e:
+        print(f"!rs raised: {e}")
+
+    message = messages[-1] if messages else None
+    if message is not None and message.content == "**Your previous request is still running, please wait**":
+        dropped_duplicates += 1
+        return
+    record("rs", start, message is not None and message.view is not None)
+    if message is None or message.view is None:
+        return
+
+    for _ in range(clicks):
+        buttons = [item for item in message.view.children if not item.disabled and item.label != "✱"]
+        if not buttons:
+            return
+        button = random.choice(buttons)
+        interaction = FakeInteraction(message, discord_user_id)
+        start = time.perf_counter()
+        try:
+            await button.callback(interaction)
+            succeeded = not any(is_failure(content) for content in interaction.followup.sent)
+        except Exception as e:
+            print(f"Click raised: {e}")
+            succeeded = False
+        if "**Still loading your previous page, please wait**" in interaction.followup.sent:
+            dropped_duplicates += 1
+            continue
+        record("click", start, succeeded)
+
+def percentile(values, fraction):
+    """
+    Returns the value at the given fraction of the sorted values.
+    """
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def print_report(elapsed, invocations):
+    """
+    Prints throughput, failures and latency percentiles for every recorded stage.
+    """
+    succeeded = len(stage_times["rs"]) - stage_failures["rs"]
+    print(f"{invocations} !rs invocations in {elapsed:.2f}s ({invocations / elapsed:.1f}/s)")
+    print(f"{succeeded} succeeded ({succeeded / elapsed:.1f}/s), {stage_failures['rs']} failed, {dropped_duplicates} dropped as duplicates")
+    print(f"{'stage':<10}{'count':>8}{'failed':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for stage, values in stage_times.items():
+        if not values:
+            continue
+        print(
+            f"{stage:<10}{len(values):>8}{stage_failures[stage]:>8}"
+            f"{percentile(values, 0.5) * 1000:>10.1f}"
+            f"{percentile(values, 0.9) * 1000:>10.1f}"
+            f"{percentile(values, 0.99) * 1000:>10.1f}"
+            f"{max(values) * 1000:>10.1f}"
+        )
+
+async def run(args):
+    """
+    Sets up the replayed API, local mirror and temporary map storage, then runs the simulated users.
+    """
+    replay = ReplayApi(os.path.abspath(args.recordings))
+    mirror = start_mirror(args.fixtures, delay=args.mirror_delay)
+    pp.set_api(replay)
+    pp.set_mirror_url(mirror.url)
+
+    # Keep the bot's real state files untouched, save_state writes to the working directory
+    os.chdir(tempfile.mkdtemp())
+    run_bot.manager = BeatmapManager(os.path.abspath("mapfolder"), run_bot.max_directory_size)
+    os.makedirs(run_bot.manager.base_directory, exist_ok=True)
+    pp.set_manager(run_bot.manager)
+    run_bot.result_cache = PPCache(args.result_cache_size)
+
+    osu_user_ids = replay.user_ids()
+    if not osu_user_ids:
+        print("No recorded scores, run python fake_osu.py record <username>... first.")
+        return
+    user_data.loaded = True
+    lazer_data.loaded = True
+    for index in range(args.users):
+        user_data.user_data[str(index)] = osu_user_ids[index % len(osu_user_ids)]
+        lazer_data.lazer_data[str(index)] = "Lazer" if args.lazer else "Standard"
+
+    pp.get_username = timed("api_user", pp.get_username)
+    pp.get_recent_activity = timed("api", pp.get_recent_activity)
+    pp.map_download = timed_async("download", pp.map_download, check=lambda beatmap_file: beatmap_file is not None)
+    pp.calc_lazer_pp = timed("calc", pp.calc_lazer_pp)
+    run_bot.build_embed = timed("render", run_bot.build_embed)
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def invocation(index):
+        async with semaphore:
+            user_index = index % args.users
+            await simulate_user(str(user_index), str(user_index % args.guilds), args.clicks)
+
+    output = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+        await asyncio.gather(*(invocation(index) for index in range(args.invocations)))
+    elapsed = time.perf_counter() - start
+
+    for task in run_bot.active_messages.values():
+        task.cancel()
+    mirror.shutdown()
+    print_report(elapsed, args.invocations)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test !rs against recorded osu! API responses and a local mirror.")
+    parser.add_argument("--invocations", type=int, default=1000, help="number of !rs invocations")
+    parser.add_argument("--users", type=int, default=100, help="number of simulated discord users")
+    parser.add_argument("--guilds", type=int, default=10, help="number of simulated guilds the users are spread over")
+    parser.add_argument("--concurrency", type=int, default=50, help="invocations running at the same time")
+    parser.add_argument("--clicks", type=int, default=2, help="navigation button clicks after each !rs")
+    parser.add_argument("--lazer", action="store_true", help="calculate as osu! Lazer instead of Standard")
+    parser.add_argument("--result-cache-size", type=int, default=1000, help="pp result cache size, 0 disables it")
+    parser.add_argument("--mirror-delay", type=float, default=0, help="seconds the mirror waits before each download")
+    parser.add_argument("--recordings", default="recordings.json")
+    parser.add_argument("--fixtures", default="fixtures")
+    asyncio.run(run(parser.parse_args()))
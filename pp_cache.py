@@ -0,0 +1,105 @@
+import os
+import json
+import asyncio
+import tempfile
+from collections import OrderedDict
+
+# The PPCache class stores the results of calc_lazer_pp keyed by score identity.
+# It evicts the least recently used results once full and can optionally save and load its state.
+# Saving is batched: changes are written at most once every save_delay seconds, in a worker thread.
+class PPCache:
+    def __init__(self, max_size: int = 1000, file_path: str = None, save_delay: float = 5):
+        self.max_size = max_size
+        self.file_path = file_path
+        self.save_delay = save_delay
+        self.results = OrderedDict()
+        self.save_task = None
+
+    def get(self, key: str):
+        """
+        Returns the cached result for the given key and marks it as recently used, or None if missing.
+        """
+        if key not in self.results:
+            return None
+        self.results.move_to_end(key)
+        return self.results[key]
+
+    def put(self, key: str, result: tuple):
+        """
+        Stores a result, evicting the least recently used one if the cache is full.
+        """
+        self.results[key] = tuple(result)
+        self.results.move_to_end(key)
+        while len(self.results) > self.max_size:
+            self.results.popitem(last=False)
+        self.schedule_save()
+
+    def schedule_save(self):
+        """
+        Schedules a save in the background, unless one is already pending.
+        Saves right away when there is no running event loop.
+        """
+        if not self.file_path:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.save_state()
+            return
+        if self.save_task is None or self.save_task.done():
+            self.save_task = loop.create_task(self.save_later())
+
+    async def save_later(self):
+        """
+        Waits save_delay seconds, then writes the cached results in a worker thread.
+        """
+        await asyncio.sleep(self.save_delay)
+        # Copied on the event loop, the worker thread must not iterate over results while they change
+        data = list(self.results.items())
+        try:
+            await asyncio.to_thread(self.write_state, data)
+        except OSError as e:
+            print(f"Saving the pp cache failed: {e}")
+
+    def save_state(self):
+        """
+        Saves the cached results to a JSON file, if a file path is set.
+        """
+        if not self.file_path:
+            return
+        self.write_state(list(self.results.items()))
+
+    def write_state(self, data):
+        """
+        Writes the results to a temporary file and moves it over the JSON file,
+        so a crash mid-write never leaves a truncated file behind.
+        """
+        directory = os.path.dirname(os.path.abspath(self.file_path))
+        file_descriptor, temp_path = tempfile.mkstemp(suffix=".part", dir=directory)
+        try:
+            with os.fdopen(file_descriptor, "w") as file:
+                json.dump(data, file)
+            os.replace(temp_path, self.file_path)
+        except:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    @staticmethod
+    def load_state(file_path="pp_cache.json", max_size: int = 1000):
+        """
+        Loads the cached results from a JSON file.
+        A missing, unreadable or corrupt file gives an empty cache.
+        """
+        cache = PPCache(max_size, file_path)
+        if not file_path or not os.path.exists(file_path):
+            return cache
+        try:
+            with open(file_path, "r") as f:
+                data = json.load(f)
+            for key, result in (data[-max_size:] if max_size else []):
+                cache.results[key] = tuple(result)
+        except (OSError, ValueError, TypeError) as e:
+            print(f"Could not load the pp cache, starting fresh: {e}")
+            cache.results.clear()
+        return cache
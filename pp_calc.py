@@ -1,17 +1,21 @@
-import rosu_pp_py as rosu
-from ossapi import Ossapi
 import json
-import requests
 import os
+import hashlib
+import asyncio
+import tempfile
 import zipfile
-from dotenv import load_dotenv
-from tqdm import tqdm
+from beatmap_download import download_beatmapset, extract_difficulty
 
-# Load environment variables from a .env file
-load_dotenv()
+# rosu_pp_py, ossapi, requests and tqdm are imported inside the functions that use them,
+# so importing this module stays cheap and bot startup doesn't pay for them up front.
 
 recent_amount = None
 manager = None
+# One lock per beatmapset ID, so a beatmapset is only downloaded by one request at a time
+download_locks = {}
+api = None
+# Beatmapset download URL set with set_mirror_url, see get_mirror_url
+mirror_url = None
 
 def set_manager(beatmap_manager):
     """
@@ -20,6 +24,28 @@ def set_manager(beatmap_manager):
     global manager
     manager = beatmap_manager
 
+def set_api(api_client):
+    """
+    Sets the osu API client to be used by the module, instead of creating an Ossapi client.
+    Any object providing user() and user_scores() works, e.g. a recorded replay for load testing.
+    """
+    global api
+    api = api_client
+
+def set_mirror_url(url):
+    """
+    Sets the beatmapset download URL, {} is replaced with the beatmapset ID.
+    """
+    global mirror_url
+    mirror_url = url
+
+def get_mirror_url():
+    """
+    Returns the beatmapset download URL, {} is replaced with the beatmapset ID.
+    The MIRROR_URL environment variable is read on each call, so a value from .env is picked up once it's loaded.
+    """
+    return mirror_url or os.getenv("MIRROR_URL", "https://beatconnect.io/b/{}")
+
 def get_manager():
     """
     Retrieves the current BeatmapManager instance.
@@ -33,6 +59,8 @@ def calc_lazer_pp(map, acc, n300, n100, n50, misses, combo, mods, large_tick_hit
     """
     Calculates the performance points (PP) for a given beatmap and score attributes.
     """
+    import rosu_pp_py as rosu
+
     beatmap = rosu.Beatmap(path = f'{map}')
     mods_json = mod_convert(mods)
     mods_list = json.loads(mods_json)
@@ -89,11 +117,18 @@ def calc_lazer_pp(map, acc, n300, n100, n50, misses, combo, mods, large_tick_hit
 
 def init_api():
     """
-    Initializes and returns an instance of the Ossapi client.
+    Returns the Ossapi client, creating it on first use.
     """
-    client_id = os.getenv("CLIENT_ID")
-    client_secret = os.getenv("CLIENT_SECRET")
-    api = Ossapi(client_id, client_secret)
+    global api
+    if api is None:
+        from dotenv import load_dotenv
+        from ossapi import Ossapi
+
+        # Load environment variables from a .env file
+        load_dotenv()
+        client_id = os.getenv("CLIENT_ID")
+        client_secret = os.getenv("CLIENT_SECRET")
+        api = Ossapi(client_id, client_secret)
     return api
 
 def get_user(username):
@@ -112,9 +147,8 @@ def get_username(user_id):
     Retrieves the username and avatar URL for a given osu user ID.
     """
     api = init_api()
-    username = api.user(f'{user_id}').username
-    avatar_url = api.user(f'{user_id}').avatar_url
-    return username, avatar_url
+    user = api.user(f'{user_id}')
+    return user.username, user.avatar_url
 
 def get_recent_activity(user_id,limit):
     """
@@ -160,10 +194,70 @@ def get_recent_score(recent, limit_number):
     miss = statistics.miss
     return accuracy, n300, n100, n50, miss, max_combo, mods, grade.value, pp, large_tick_hits, slider_end_hits, large_tick_miss
 
+def get_score_key(recent, limit_number, lazer):
+    """
+    Returns the key identifying a pp calculation for the score in the recent activity.
+    Uses the osu score id, or a hash of the beatmap checksum, mods and hit statistics if the score has no id.
+    """
+    score = recent[limit_number]
+    if score.id:
+        return f'{score.id}:{lazer}'
+
+    statistics = score.statistics
+    identity = [
+        score.beatmap.checksum,
+        mod_convert(score.mods),
+        statistics.great, statistics.ok, statistics.meh, statistics.miss,
+        statistics.large_tick_hit, statistics.large_tick_miss, statistics.slider_tail_hit,
+        score.max_combo,
+        lazer
+    ]
+    return hashlib.sha1(json.dumps(identity).encode()).hexdigest()
+
+def download_map(manager, beatmapset_id, url, search_text):
+    """
+    Downloads a beatmapset into the cache and extracts the difficulty, in a worker thread.
+    The difficulty is extracted and its CRC checked before the archive is moved into the cache,
+    so a corrupt download is never cached.
+    """
+    manager.add_beatmap(beatmapset_id)
+    path = manager.get_file_path(beatmapset_id)
+    file_descriptor, temp_path = tempfile.mkstemp(suffix=".part", dir=manager.base_directory)
+    os.close(file_descriptor)
+
+    beatmap_file = None
+    try:
+        index = download_beatmapset(url, temp_path)
+        beatmap_file = extract_difficulty(temp_path, index, search_text, manager.base_directory)
+        os.replace(temp_path, path)
+    except:
+        if beatmap_file and os.path.exists(beatmap_file):
+            os.remove(beatmap_file)
+        raise
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    manager.use_beatmap(beatmapset_id)
+    manager.save_state()
+    return beatmap_file
+
+def extract_map(manager, beatmapset_id, search_text):
+    """
+    Extracts the difficulty from a cached beatmapset, in a worker thread.
+    """
+    beatmap_file = extract_difficulty(manager.get_file_path(beatmapset_id), None, search_text, manager.base_directory)
+    manager.use_beatmap(beatmapset_id)
+    manager.save_state()
+    return beatmap_file
+
 async def map_download(beatmap, on_download_start=None, on_download_fail=None):
     """
     Downloads the specified beatmap and extracts the required files.
+    Downloading, extracting and saving the manager state run in worker threads, off the event loop.
     """
+    import requests
+
     try:
         os.mkdir("mapfolder")
     except FileExistsError:
@@ -174,60 +268,31 @@ async def map_download(beatmap, on_download_start=None, on_download_fail=None):
         print(f"An error occurred: {e}")
 
     manager = get_manager()
-    main_path = os.path.dirname(os.path.abspath(__file__))
-    folder_path = os.path.join(main_path, "mapfolder")
     path = manager.get_file_path(beatmap[0])
-    temp_path = path + ".part"
+    search_text = f'[{beatmap[1]}]'
 
-    if os.path.exists(temp_path):
-        os.remove(temp_path)
+    lock = download_locks.setdefault(beatmap[0], asyncio.Lock())
+    async with lock:
+        # Checked under the lock, another request may have just downloaded it
+        if os.path.exists(path):
+            try:
+                return await asyncio.to_thread(extract_map, manager, beatmap[0], search_text)
+            except zipfile.BadZipFile as e:
+                # A corrupt archive is removed from the cache and downloaded again
+                print(f"Cached beatmapset {beatmap[0]} is corrupt, downloading it again: {e}")
+                os.remove(path)
 
-    if not os.path.exists(path):
-        manager.add_beatmap(beatmap[0])
         if on_download_start:
             await on_download_start()
 
-        url = f'https://beatconnect.io/b/{beatmap[0]}'
-
+        url = get_mirror_url().format(beatmap[0])
         try:
-            with requests.get(url, stream=True, timeout=10) as resp:
-                resp.raise_for_status()
-                total_size = int(resp.headers.get('content-length', 0))
-                chunk_size = 8192
-
-                with open(temp_path, 'wb') as f, tqdm(
-                        desc="Downloading",
-                        total=total_size,
-                        unit="B",
-                        unit_scale=True,
-                        unit_divisor=1024
-                ) as bar:
-                    for buff in resp.iter_content(chunk_size=chunk_size):
-                        f.write(buff)
-                        bar.update(len(buff))
-
-            os.rename(temp_path, path)
-
-        except (requests.Timeout, requests.ConnectionError, requests.HTTPError):
+            return await asyncio.to_thread(download_map, manager, beatmap[0], url, search_text)
+        except (requests.RequestException, zipfile.BadZipFile, OSError) as e:
+            print(f"Download of beatmapset {beatmap[0]} failed: {e}")
             if on_download_fail:
                 await on_download_fail()
             return
-        finally:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-
-    search_text = f'[{beatmap[1]}]'
-    with zipfile.ZipFile(path, 'r') as zip_ref:
-        matching_files = [file for file in zip_ref.namelist() if search_text in file]
-
-        for file in matching_files:
-            zip_ref.extract(file, folder_path)
-            map_file = file
-
-    manager.use_beatmap(beatmap[0])
-    manager.save_state()
-    beatmap_file = os.path.join(manager.base_directory, map_file)
-    return beatmap_file
 
 def mod_convert(mods):
     """
@@ -0,0 +1,121 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+# The RsScheduler class limits how much !rs pipeline work runs at once, per discord user, per guild and in total.
+# Requests over the limits wait in a queue and are started in order as soon as their user and guild have a free slot,
+# so one busy guild can't hold up everyone else. Waiting requests are told their position again whenever the queue moves.
+class RsScheduler:
+    def __init__(self, max_per_user: int = 1, max_per_guild: int = 3, max_total: int = 8):
+        self.max_per_user = max_per_user
+        self.max_per_guild = max_per_guild
+        self.max_total = max_total
+        self.running_users = {}
+        self.running_guilds = {}
+        self.running_total = 0
+        self.waiting = []
+        self.queue_moved = None
+
+    def is_pending(self, user_id) -> bool:
+        """
+        Checks if the user has a request running or waiting in the queue.
+        """
+        return user_id in self.running_users or any(entry[0] == user_id for entry in self.waiting)
+
+    def can_start(self, user_id, guild_id) -> bool:
+        """
+        Checks if a request from the user and guild fits in the limits right now.
+        Requests without a guild (direct messages) are only limited per user and in total.
+        """
+        return (
+            self.running_total < self.max_total
+            and self.running_users.get(user_id, 0) < self.max_per_user
+            and (guild_id is None or self.running_guilds.get(guild_id, 0) < self.max_per_guild)
+        )
+
+    def start(self, user_id, guild_id):
+        """
+        Counts a request from the user and guild as running.
+        """
+        self.running_total += 1
+        self.running_users[user_id] = self.running_users.get(user_id, 0) + 1
+        if guild_id is not None:
+            self.running_guilds[guild_id] = self.running_guilds.get(guild_id, 0) + 1
+
+    def finish(self, user_id, guild_id):
+        """
+        Releases the slot of a finished request and starts the waiting requests that now fit.
+        """
+        self.running_total -= 1
+        self.running_users[user_id] -= 1
+        if self.running_users[user_id] == 0:
+            del self.running_users[user_id]
+        if guild_id is not None:
+            self.running_guilds[guild_id] -= 1
+            if self.running_guilds[guild_id] == 0:
+                del self.running_guilds[guild_id]
+        self.dispatch()
+
+    def notify_queue_moved(self):
+        """
+        Wakes the waiting requests so they can report their new position.
+        """
+        if self.queue_moved is not None and not self.queue_moved.done():
+            self.queue_moved.set_result(None)
+        self.queue_moved = None
+
+    def dispatch(self):
+        """
+        Starts waiting requests in queue order, skipping those whose user or guild is still at its limit.
+        """
+        moved = False
+        for entry in list(self.waiting):
+            user_id, guild_id, future = entry
+            if future.done():
+                self.waiting.remove(entry)
+                moved = True
+            elif self.can_start(user_id, guild_id):
+                self.waiting.remove(entry)
+                self.start(user_id, guild_id)
+                future.set_result(None)
+                moved = True
+        if moved:
+            self.notify_queue_moved()
+
+    @asynccontextmanager
+    async def slot(self, user_id, guild_id, on_queued=None):
+        """
+        Waits for a free slot for the user and guild and holds it for the duration of the block.
+        If the request has to wait, on_queued is awaited with its position in the queue,
+        and again with the new position every time it changes.
+        """
+        if self.can_start(user_id, guild_id):
+            self.start(user_id, guild_id)
+        else:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            entry = [user_id, guild_id, future]
+            self.waiting.append(entry)
+            try:
+                reported_position = None
+                while not future.done():
+                    if on_queued and entry in self.waiting:
+                        position = self.waiting.index(entry) + 1
+                        if position != reported_position:
+                            reported_position = position
+                            await on_queued(position)
+                            continue
+                    if self.queue_moved is None:
+                        self.queue_moved = loop.create_future()
+                    await asyncio.wait({future, self.queue_moved}, return_when=asyncio.FIRST_COMPLETED)
+            except BaseException:
+                if entry in self.waiting:
+                    self.waiting.remove(entry)
+                    self.notify_queue_moved()
+                elif future.done() and not future.cancelled():
+                    self.finish(user_id, guild_id)
+                raise
+
+        try:
+            yield
+        finally:
+            self.finish(user_id, guild_id)
@@ -1,3 +1,8 @@
+import time
+
+# Started before the other imports, so the reported startup time includes them
+startup_time = time.perf_counter()
+
 import os
 import discord
 from discord.ext import commands
@@ -11,38 +16,83 @@ from asyncio import create_task
 from dotenv import load_dotenv
 from form import InputModal
 from beatmap_manager import BeatmapManager
+from pp_cache import PPCache
+from rs_scheduler import RsScheduler
 
-# Load the saved state of the BeatmapManager from a JSON file
-manager = BeatmapManager.load_state("beatmap_data.json")
+# The BeatmapManager state is loaded from a JSON file on first use, see init_manager
+manager = None
 max_directory_size = 5000 * 1024 * 1024  # 5000MB in Bytes
 
+# pp results are cached by score, see init_result_cache
+result_cache = None
+result_cache_size = 1000
+result_cache_file = "pp_cache.json"  # Set to None to keep results in memory only
+
+# Limits on concurrent !rs pipeline work, requests over them are queued
+scheduler = RsScheduler(max_per_user=1, max_per_guild=3, max_total=8)
+
 # Load environment variables from a .env file
 load_dotenv()
 
 active_messages = {}
 
+# Seconds a paginator click waits for its page before deferring, Discord needs an answer within 3
+quick_response_time = 2
+
 # Set up the bot with the necessary intents
 intents = discord.Intents.default()
 intents.message_content = True
 bot = commands.Bot(command_prefix="!", intents=intents, help_command=None)
 
+def init_manager():
+    """
+    Loads the BeatmapManager state and hands it to pp_calc.
+    Only runs once, later calls return the already loaded manager.
+    """
+    global manager
+    if manager is None:
+        manager = BeatmapManager.load_state("beatmap_data.json")
+        main_path = os.path.dirname(os.path.abspath(__file__))
+        folder_path = os.path.join(main_path, "mapfolder")
+        manager.base_directory = folder_path
+        manager.max_directory_size = max_directory_size
+        os.makedirs(manager.base_directory, exist_ok=True)
+        pp.set_manager(manager)
+    return manager
+
+def init_result_cache():
+    """
+    Loads the pp result cache on first use.
+    Only runs once, later calls return the already loaded cache.
+    """
+    global result_cache
+    if result_cache is None:
+        result_cache = PPCache.load_state(result_cache_file, result_cache_size)
+    return result_cache
+
 @bot.event
 async def on_ready():
     """
     Event handler for when the bot is ready.
-    Initializes the BeatmapManager and loads user data.
+    Also runs on every reconnect, so it doesn't load any state; user data and the
+    BeatmapManager are loaded on first use instead.
     """
-    global manager
-    main_path = os.path.dirname(os.path.abspath(__file__))
-    folder_path = os.path.join(main_path, "mapfolder")
-    manager.base_directory = folder_path
-    manager.max_directory_size = max_directory_size
-    os.makedirs(manager.base_directory, exist_ok=True)
-    pp.set_manager(manager)
-    user_data.load_osu_user_data()
-    lazer_data.load_user_lazer_data()
+    global startup_time
+    if startup_time is not None:
+        print(f"Startup took {time.perf_counter() - startup_time:.2f}s")
+        startup_time = None
     print(f"We have logged in as {bot.user}")
 
+@bot.command()
+@commands.is_owner()
+async def sync(ctx):
+    """
+    Registers the app commands (/rs) with Discord. Owner only.
+    Only needed after app commands are added or changed, so it isn't done on every start.
+    """
+    synced = await bot.tree.sync()
+    await ctx.send(f"**Synced {len(synced)} app commands**")
+
 @bot.command()
 async def help(ctx):
     """
@@ -58,7 +108,7 @@ async def help(ctx):
         "**!getuser** - Checks osu username for a discord account\n"
         "**!setplaymode** - Sets osu playmode **(Standard or Lazer)**\n"
         "**!getplaymode** - Checks osu playmode for a discord account\n"
-        "**!rs -** Checks recently played beatmap score"
+        "**!rs** or **/rs** - Checks recently played beatmap score"
     )
 
     await ctx.send(embed=embed)
@@ -123,26 +173,44 @@ async def getplaymode(ctx):
     else:
         await ctx.send(f"**You didn't set your prefered playmode yet**")
 
-async def get_map_data(osu_user_id, user, playmode, position, lazer, on_download_start, on_download_fail):
+async def get_map_data(osu_user_id, user, playmode, position, lazer, on_download_start, on_download_fail, on_progress=None):
     """
     Retrieves data for the most recent osu play for the specified user.
+    Blocking API calls and the pp calculation run in worker threads so the event loop stays responsive.
+    Returns None if there is no play at the position or the map download failed, errors are raised.
     """
-    recent = pp.get_recent_activity(osu_user_id, 10)
-    if recent[1] == 0:
+    if on_progress:
+        await on_progress("**Fetching recent plays...**")
+    recent = await asyncio.to_thread(pp.get_recent_activity, osu_user_id, 10)
+    if recent[1] <= position:
         return None
 
     score = pp.get_recent_score(recent[0], position)
     beatmap = pp.get_beatmap(recent[0], position)
 
     full_title = f'{beatmap[2]} [{beatmap[1]}]'
-    beatmap_file = await pp.map_download(beatmap, on_download_start, on_download_fail)
-    try:
-        calc_result = pp.calc_lazer_pp(
-            beatmap_file, score[0], score[1], score[2], score[3], score[4], score[5],
-            score[6], score[9], score[10], score[11], lazer
-        )
-    except:
-        return
+
+    # Repeat views of a score skip the download and calculation entirely
+    cache = init_result_cache()
+    score_key = pp.get_score_key(recent[0], position, lazer)
+    calc_result = cache.get(score_key)
+    if calc_result is None:
+        beatmap_file = await pp.map_download(beatmap, on_download_start, on_download_fail)
+        if beatmap_file is None:
+            return None
+        try:
+            if on_progress:
+                await on_progress("**Calculating performance...**")
+            calc_result = await asyncio.to_thread(
+                pp.calc_lazer_pp,
+                beatmap_file, score[0], score[1], score[2], score[3], score[4], score[5],
+                score[6], score[9], score[10], score[11], lazer
+            )
+        finally:
+            # calc_lazer_pp removes the file itself, unless it failed before that
+            if os.path.exists(beatmap_file):
+                os.remove(beatmap_file)
+        cache.put(score_key, calc_result)
 
     accuracy = format(score[0] * 100, ".2f")
     n300 = score[1] or 0
@@ -162,36 +230,53 @@ async def get_map_data(osu_user_id, user, playmode, position, lazer, on_download
     }
     return map_data, recent
 
-@bot.command()
-async def rs(ctx):
+def build_embed(map_data):
+    """
+    Builds the score embed from the data returned by get_map_data.
+    """
+    embed = discord.Embed(
+        title="",
+        color=discord.Color.blue()
+    )
+    embed.set_author(name=map_data[0]['map'], icon_url=map_data[0]['user_url'])
+    embed.description = (
+        f"{map_data[0]['result']}\n"
+        f"{map_data[0]['score_details']}"
+    )
+    embed.set_footer(text=f"{map_data[0]['server']}  •  {date.today()}", icon_url=map_data[0]['image_osu_url'])
+    embed.set_thumbnail(url=map_data[0]['image_url'])
+    return embed
+
+async def recent_play(discord_user_id, guild_id, send, on_progress=None):
     """
     Retrieves and displays the most recent osu play for the discord user.
+    Shared by !rs and /rs, which only differ in how messages are sent.
+    Pipeline work goes through the scheduler, so it is limited per user and per guild.
     """
+    init_manager()
     current_position = [1]
+    download_failed = []
 
     async def on_download_start():
-        await ctx.send("**Map seen for the first time, please wait**")
+        await send("**Map seen for the first time, please wait**")
 
     async def on_download_fail():
-        await ctx.send("**There has been an unknown error while downloading the map**")
+        download_failed.append(True)
+        await send("**There has been an unknown error while downloading the map**")
 
     async def on_input_submit(interaction: discord.Interaction, value):
-        current_position[0] = value
-        await update_embed(interaction)
-        await button_check(interaction)
-        if not interaction.response.is_done():
-            await interaction.response.defer(ephemeral=True)
+        await move_to(interaction, value)
 
-    async def button_check(interaction: discord.Interaction):
+    def button_check(position):
         """
-        Updates the state of the navigation buttons based on the current position.
+        Updates the state of the navigation buttons based on the given position.
         """
-        if current_position[0] == 1:
+        if position == 1:
             button_max_left.disabled = True
             button_left.disabled = True
             button_max_right.disabled = False
             button_right.disabled = False
-        elif current_position[0] == map_data[1][1]:
+        elif position == map_data[1][1]:
             button_max_right.disabled = True
             button_right.disabled = True
             button_max_left.disabled = False
@@ -202,11 +287,11 @@ async def rs(ctx):
             button_max_left.disabled = False
             button_left.disabled = False
 
-        await start_timer(interaction.message.id)
-        if interaction.response.is_done():
-            await interaction.followup.edit_message(interaction.message.id, view=view)
-        else:
-            await interaction.response.edit_message(view=view)
+    def view_state(embed):
+        """
+        Returns what the message currently shows, used to skip edits that wouldn't change anything.
+        """
+        return embed.to_dict(), [item.disabled for item in view.children]
 
     async def input_callback(interaction: discord.Interaction):
         """
@@ -214,80 +299,111 @@ async def rs(ctx):
         """
         modal = InputModal((map_data[1][1]), discord.Interaction, on_input_submit)
         await interaction.response.send_modal(modal)
-        if not interaction.response.is_done():
-            await interaction.response.defer(ephemeral=True)
 
     async def max_left_callback(interaction: discord.Interaction):
         """
         Moves to the first position in the recent plays list.
         """
-        current_position[0] = 1
-        await button_check(interaction)
-        await update_embed(interaction)
-        if not interaction.response.is_done():
-            await interaction.response.defer(ephemeral=True)
+        await move_to(interaction, 1)
 
     async def left_callback(interaction: discord.Interaction):
         """
         Moves to the previous position in the recent plays list.
         """
-        current_position[0] -= 1
-        await button_check(interaction)
-        await update_embed(interaction)
-        if not interaction.response.is_done():
-            await interaction.response.defer(ephemeral=True)
+        await move_to(interaction, current_position[0] - 1)
 
     async def max_right_callback(interaction: discord.Interaction):
         """
         Moves to the last position in the recent plays list.
         """
-        current_position[0] =map_data[1][1]
-        await button_check(interaction)
-        await update_embed(interaction)
-        if not interaction.response.is_done():
-            await interaction.response.defer(ephemeral=True)
+        await move_to(interaction, map_data[1][1])
 
     async def right_callback(interaction: discord.Interaction):
         """
         Moves to the next position in the recent plays list.
         """
-        current_position[0] += 1
-        await button_check(interaction)
-        await update_embed(interaction)
-        if not interaction.response.is_done():
-            await interaction.response.defer(ephemeral=True)
+        await move_to(interaction, current_position[0] + 1)
 
-    async def update_embed(interaction: discord.Interaction):
+    async def move_to(interaction: discord.Interaction, position):
         """
-        Updates the embed with the data for the current position.
+        Moves to the given position and applies the new embed and buttons.
+        If the page is ready within quick_response_time (e.g. a cached result) the interaction is answered
+        with a single edit, otherwise it is deferred first and edited once the page is ready.
+        Clicks while the user's previous page is still loading are turned away instead of queued.
         """
-        try:
-            map_data = await get_map_data(osu_user_id, user, playmode, current_position[0] - 1, lazer, on_download_start, on_download_fail)
-            if not map_data:
+        if scheduler.is_pending(str(interaction.user.id)):
+            await interaction.response.send_message("**Still loading your previous page, please wait**", ephemeral=True)
+            return
+
+        await start_timer(interaction.message.id)
+        response_lock = asyncio.Lock()
+
+        async def defer():
+            async with response_lock:
                 if not interaction.response.is_done():
-                    await interaction.response.send_message("**Invalid position. No data available.**", ephemeral=True)
-                else:
-                    await interaction.followup.send("**Invalid position. No data available.**", ephemeral=True)
+                    await interaction.response.defer()
+
+        async def reply(text):
+            async with response_lock:
+                if not interaction.response.is_done():
+                    await interaction.response.send_message(text, ephemeral=True)
+                    return
+            await interaction.followup.send(text, ephemeral=True)
+
+        async def on_page_download_start():
+            await defer()
+            await interaction.followup.send("**Map seen for the first time, please wait**", ephemeral=True)
+
+        page_download_failed = []
+
+        async def on_page_download_fail():
+            page_download_failed.append(True)
+            await reply("**There has been an unknown error while downloading the map**")
+
+        page_queue_message = []
+
+        async def on_page_queued(position):
+            text = f"**Lots of requests right now, you are #{position} in the queue**"
+            if page_queue_message:
+                await page_queue_message[0].edit(content=text)
                 return
-        except:
+            await defer()
+            page_queue_message.append(await interaction.followup.send(text, ephemeral=True, wait=True))
+
+        async def load_page():
+            # Counted against whoever clicked, not the owner of the message
+            async with scheduler.slot(str(interaction.user.id), guild_id, on_page_queued):
+                return await get_map_data(osu_user_id, user, playmode, position - 1, lazer, on_page_download_start, on_page_download_fail)
+
+        try:
+            task = create_task(load_page())
+            done, _ = await asyncio.wait({task}, timeout=quick_response_time)
+            if not done:
+                await defer()
+            page_data = await task
+            if not page_data:
+                if not page_download_failed:
+                    await reply("**Invalid position. No data available.**")
+                return
+        except Exception as e:
+            print(f"Failed to retrieve play #{position}: {e}")
+            await reply("**Something went wrong while retrieving this play, please try again**")
             return
 
-        embed = discord.Embed(
-            title="",
-            color=discord.Color.blue()
-        )
-        embed.set_author(name=map_data[0]['map'], icon_url=map_data[0]['user_url'])
-        embed.description = (
-            f"{map_data[0]['result']}\n"
-            f"{map_data[0]['score_details']}"
-        )
-        embed.set_footer(text=f"{map_data[0]['server']}  •  {date.today()}", icon_url=map_data[0]['image_osu_url'])
-        embed.set_thumbnail(url=map_data[0]['image_url'])
-
-        if interaction.response.is_done():
-            await interaction.followup.edit_message(interaction.message.id, embed=embed, view=view)
-        else:
-            await interaction.response.edit_message(embed=embed, view=view)
+        current_position[0] = position
+        embed = build_embed(page_data)
+        button_check(position)
+
+        state = view_state(embed)
+        if state == shown_state[0]:
+            await defer()
+            return
+        shown_state[0] = state
+        async with response_lock:
+            if not interaction.response.is_done():
+                await interaction.response.edit_message(embed=embed, view=view)
+                return
+        await interaction.followup.edit_message(interaction.message.id, embed=embed, view=view)
 
     async def start_timer(message_id):
         """
@@ -307,46 +423,54 @@ async def rs(ctx):
 
         active_messages[message_id] = create_task(timer_task())
 
+    if scheduler.is_pending(discord_user_id):
+        await send("**Your previous request is still running, please wait**")
+        return
+
     for task in list(active_messages.values()):
         task.cancel()
     active_messages.clear()
 
-    discord_user_id = str(ctx.author.id)
-    osu_user_id = user_data.get_osu_user(discord_user_id)
-    if osu_user_id:
-        user = pp.get_username(osu_user_id)
-        if user == None:
-            await ctx.send("**User not found, did u set your username correctly?**")
-            return
-    else:
-        await ctx.send("**User not found, did u set your username correctly?**")
-        return
+    queue_message = []
 
-    playmode = lazer_data.get_user_lazer(discord_user_id)
-    if playmode == None:
-        playmode = "Standard"
-        lazer = False
-    elif playmode == "Standard":
-        lazer = False
-    else:
-        lazer = True
-
-    try:
-        map_data = await get_map_data(osu_user_id, user, playmode, 0, lazer, on_download_start, on_download_fail)
-        # Create the embed
-        embed = discord.Embed(
-            title="",
-            color=discord.Color.blue()
-        )
-        embed.set_author(name=map_data[0]['map'], icon_url=map_data[0]['user_url'])
-        embed.description = (
-            f"{map_data[0]['result']}\n"
-            f"{map_data[0]['score_details']}"
-        )
-        embed.set_footer(text=f"{map_data[0]['server']}  •  {date.today()}", icon_url=map_data[0]['image_osu_url'])
-        embed.set_thumbnail(url=map_data[0]['image_url'])
-    except:
-        return
+    async def on_queued(position):
+        text = f"**Lots of requests right now, you are #{position} in the queue**"
+        if queue_message:
+            await queue_message[0].edit(content=text)
+        else:
+            queue_message.append(await send(text))
+
+    async with scheduler.slot(discord_user_id, guild_id, on_queued):
+        try:
+            osu_user_id = user_data.get_osu_user(discord_user_id)
+            if osu_user_id:
+                user = await asyncio.to_thread(pp.get_username, osu_user_id)
+                if user == None:
+                    await send("**User not found, did u set your username correctly?**")
+                    return
+            else:
+                await send("**User not found, did u set your username correctly?**")
+                return
+
+            playmode = lazer_data.get_user_lazer(discord_user_id)
+            if playmode == None:
+                playmode = "Standard"
+                lazer = False
+            elif playmode == "Standard":
+                lazer = False
+            else:
+                lazer = True
+
+            map_data = await get_map_data(osu_user_id, user, playmode, 0, lazer, on_download_start, on_download_fail, on_progress)
+            if not map_data:
+                if not download_failed:
+                    await send("**No recent play data available.**")
+                return
+            embed = build_embed(map_data)
+        except Exception as e:
+            print(f"Failed to retrieve recent play: {e}")
+            await send("**Something went wrong while retrieving your recent play, please try again**")
+            return
 
     # Create navigation buttons
     button_max_left = Button(label="◂◂", style=discord.ButtonStyle.secondary)
@@ -375,9 +499,33 @@ async def rs(ctx):
     view.add_item(button_right)
     view.add_item(button_max_right)
 
-    message = await ctx.send(f"**Recent osu! {playmode} Play for {user[0]}:**", embed=embed, view=view)
+    message = await send(f"**Recent osu! {playmode} Play for {user[0]}:**", embed=embed, view=view)
+    shown_state = [view_state(embed)]
 
     await start_timer(message.id)
 
-# Run the bot with the token from the environment variables
-bot.run(os.getenv("DISCORD_TOKEN"))
+@bot.command()
+async def rs(ctx):
+    """
+    Retrieves and displays the most recent osu play for the discord user.
+    """
+    guild_id = str(ctx.guild.id) if ctx.guild else None
+    await recent_play(str(ctx.author.id), guild_id, ctx.send)
+
+@bot.tree.command(name="rs", description="Checks recently played beatmap score")
+async def rs_slash(interaction: discord.Interaction):
+    """
+    App command version of !rs.
+    Defers right away and reports progress by editing the response, so slow downloads don't fail the interaction.
+    """
+    await interaction.response.defer(thinking=True)
+
+    async def send(content=None, embed=None, view=None):
+        return await interaction.edit_original_response(content=content, embed=embed, view=view)
+
+    guild_id = str(interaction.guild_id) if interaction.guild_id else None
+    await recent_play(str(interaction.user.id), guild_id, send, on_progress=send)
+
+if __name__ == "__main__":
+    # Run the bot with the token from the environment variables
+    bot.run(os.getenv("DISCORD_TOKEN"))
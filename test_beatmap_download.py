@@ -0,0 +1,91 @@
+import io
+import os
+import zipfile
+import pytest
+from beatmap_download import read_zip_index, read_zip_index_from_file, extract_difficulty
+
+# Tests for the zip central directory parser and difficulty extraction in beatmap_download.py.
+# Run with python -m pytest test_beatmap_download.py
+
+def make_zip(files, comment=b"", compression=zipfile.ZIP_DEFLATED):
+    """
+    Builds a zip archive in memory from a dict of file name -> content and returns its bytes.
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression) as zip_ref:
+        for name, content in files.items():
+            zip_ref.writestr(name, content)
+        zip_ref.comment = comment
+    return buffer.getvalue()
+
+def write_zip(tmp_path, data):
+    """
+    Writes archive bytes to a file in tmp_path and returns its path.
+    """
+    zip_path = tmp_path / "beatmapset.zip"
+    zip_path.write_bytes(data)
+    return str(zip_path)
+
+FILES = {
+    "Artist - Title (Mapper) [Easy].osu": "osu file format v14\n" * 50,
+    "Artist - Title (Mapper) [Hard].osu": "osu file format v14\n" * 80,
+    "audio.mp3": b"\x00\x01" * 1000,
+}
+
+def test_index_matches_zipfile(tmp_path):
+    data = make_zip(FILES)
+    assert read_zip_index(data, len(data)) == read_zip_index_from_file(write_zip(tmp_path, data))
+
+def test_comment():
+    data = make_zip(FILES, comment=b"downloaded from a mirror")
+    assert set(read_zip_index(data, len(data))) == set(FILES)
+
+def test_truncated_archive():
+    data = make_zip(FILES)
+    with pytest.raises(zipfile.BadZipFile):
+        read_zip_index(data[:-5], len(data) - 5)
+    with pytest.raises(zipfile.BadZipFile):
+        read_zip_index(data[:len(data) // 2], len(data) // 2)
+
+def test_trailing_data():
+    data = make_zip(FILES) + b"trailing garbage"
+    with pytest.raises(zipfile.BadZipFile):
+        read_zip_index(data, len(data))
+
+def test_central_directory_larger_than_tail():
+    data = make_zip({f"{index:04}.osu": "x" for index in range(100)})
+    tail = data[-200:]
+    assert read_zip_index(tail, len(data)) is None
+
+def test_zip64_falls_back_to_zipfile(tmp_path):
+    data = make_zip({f"{index}": "" for index in range(0xFFFF + 1)}, compression=zipfile.ZIP_STORED)
+    assert read_zip_index(data, len(data)) is None
+    assert len(read_zip_index_from_file(write_zip(tmp_path, data))) == 0xFFFF + 1
+
+@pytest.mark.parametrize("use_index", [True, False])
+def test_extract_difficulty(tmp_path, use_index):
+    data = make_zip(FILES)
+    zip_path = write_zip(tmp_path, data)
+    index = read_zip_index(data, len(data)) if use_index else None
+    beatmap_file = extract_difficulty(zip_path, index, "[Hard]", str(tmp_path))
+    with open(beatmap_file, "r") as file:
+        assert file.read() == FILES["Artist - Title (Mapper) [Hard].osu"]
+
+def test_missing_difficulty(tmp_path):
+    data = make_zip(FILES)
+    zip_path = write_zip(tmp_path, data)
+    with pytest.raises(FileNotFoundError):
+        extract_difficulty(zip_path, read_zip_index(data, len(data)), "[Insane]", str(tmp_path))
+
+@pytest.mark.parametrize("use_index", [True, False])
+def test_crc_mismatch(tmp_path, use_index):
+    content = "osu file format v14\n" * 50
+    data = bytearray(make_zip({"Artist - Title (Mapper) [Hard].osu": content}, compression=zipfile.ZIP_STORED))
+    data[data.index(content.encode()) + 10] ^= 0xFF
+    zip_path = write_zip(tmp_path, bytes(data))
+
+    # The structure is intact, only the file data is wrong
+    index = read_zip_index(bytes(data), len(data))
+    with pytest.raises(zipfile.BadZipFile):
+        extract_difficulty(zip_path, index if use_index else None, "[Hard]", str(tmp_path))
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".osu")]
@@ -1,10 +1,14 @@
 import json
 
 user_data = {}
+loaded = False
 
 def load_osu_user_data():
-    """Load user data from a JSON file into memory."""
-    global user_data
+    """Load user data from a JSON file into memory, only the first time it is called."""
+    global user_data, loaded
+    if loaded:
+        return
+    loaded = True
     try:
         with open("user_data.json", "r") as file:
             user_data.update(json.load(file))
@@ -18,9 +22,11 @@ def save_osu_user_data():
 
 def set_osu_user(discord_user_id, value):
     """Set a value for a given user ID."""
+    load_osu_user_data()
     user_data[discord_user_id] = value
     save_osu_user_data()
 
 def get_osu_user(discord_user_id):
     """Get the value associated with a given user ID."""
+    load_osu_user_data()
     return user_data.get(discord_user_id)
\ No newline at end of file